@@ -2,3 +2,6 @@ import stripe
 
 STRIPE_API_KEY = "type-your-stripe-key"
 stripe.api_key = STRIPE_API_KEY
+
+# seconds between full reloads of the in-memory email directories
+EMAIL_DIRECTORY_RESYNC_SECONDS = 300
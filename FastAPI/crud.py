@@ -29,6 +29,10 @@ def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
 
+def get_user_emails(db: Session):
+    return db.query(models.User.id, models.User.email).all()
+
+
 def authenticate_user(db: Session, email: str, password: str):
     user = get_user_by_email(db, email)
     if not user:
@@ -59,6 +63,10 @@ def get_patient_by_email(db: Session, email: str):
     return db.query(models.Patient).filter(models.Patient.email == email).first()
 
 
+def get_patient_emails(db: Session):
+    return db.query(models.Patient.id, models.Patient.email).all()
+
+
 def get_patients(db: Session):
     return db.query(models.Patient).all()
 
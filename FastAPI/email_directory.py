@@ -0,0 +1,174 @@
+import hashlib
+import math
+import sys
+import threading
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+# BLOOM FILTER
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        # optimal bit count and hash count for the requested capacity and error rate
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # double hashing: derive k positions from two 64 bit halves of one digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def expected_false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+
+# EMAIL DIRECTORY
+class EmailDirectory:
+    """
+    In-process directory of the emails stored in one table. A Bloom filter answers definite misses without touching
+    the database; possible hits are checked against a case-normalized index and, if present there, must still be
+    confirmed against the database's unique index by the caller.
+    """
+
+    def __init__(self, name: str, error_rate: float = 0.01, min_capacity: int = 1024):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._pending = None  # writes seen while a reload is running, replayed onto the new index
+        self._bloom = BloomFilter(min_capacity, error_rate)
+        self._index = {}  # normalized email -> set of row ids
+        self._ids = {}  # row id -> normalized email
+        self.loaded = False
+        self.lookups = 0
+        self.bloom_negatives = 0
+        self.false_positives = 0
+
+    def load(self, rows):
+        """Rebuild the directory from (id, email) pairs."""
+        self.reload(lambda: rows)
+
+    def reload(self, fetch_rows):
+        """
+        Rebuild the directory from the (id, email) pairs returned by fetch_rows, sizing the Bloom filter for twice the
+        current row count. Adds and discards made after fetch_rows starts are replayed onto the new index before it is
+        swapped in, so writes from this process are never lost to a concurrent snapshot.
+        """
+        with self._reload_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                rows = [(row_id, normalize_email(email)) for row_id, email in fetch_rows() if email]
+                bloom = BloomFilter(max(len(rows) * 2, self.min_capacity), self.error_rate)
+                index, ids = {}, {}
+                for row_id, key in rows:
+                    self._add(bloom, index, ids, row_id, key)
+                with self._lock:
+                    for row_id, key in self._pending:
+                        if key is None:
+                            self._discard(index, ids, row_id)
+                        else:
+                            self._add(bloom, index, ids, row_id, key)
+                    self._bloom, self._index, self._ids = bloom, index, ids
+                    self.loaded = True
+            finally:
+                with self._lock:
+                    self._pending = None
+
+    def add(self, row_id: int, email: str):
+        key = normalize_email(email)
+        with self._lock:
+            self._add(self._bloom, self._index, self._ids, row_id, key)
+            if self._pending is not None:
+                self._pending.append((row_id, key))
+
+    def discard(self, row_id: int):
+        # Bloom filters cannot forget keys, the stale bits only cost a false positive until the next resync
+        with self._lock:
+            self._discard(self._index, self._ids, row_id)
+            if self._pending is not None:
+                self._pending.append((row_id, None))
+
+    @staticmethod
+    def _add(bloom, index, ids, row_id, key):
+        if ids.get(row_id) == key:
+            # unchanged email, re-adding would only inflate the Bloom filter's key count
+            return
+        EmailDirectory._discard(index, ids, row_id)
+        bloom.add(key)
+        index.setdefault(key, set()).add(row_id)
+        ids[row_id] = key
+
+    @staticmethod
+    def _discard(index, ids, row_id):
+        key = ids.pop(row_id, None)
+        if key is None:
+            return
+        owners = index.get(key)
+        if owners is not None:
+            owners.discard(row_id)
+            if not owners:
+                del index[key]
+
+    def might_contain(self, email: str) -> bool:
+        """Return False when the email is definitely not stored; True means the database must be asked."""
+        if not self.loaded:
+            return True
+        key = normalize_email(email)
+        with self._lock:
+            self.lookups += 1
+            if key not in self._bloom:
+                self.bloom_negatives += 1
+                return False
+            if key not in self._index:
+                self.false_positives += 1
+                return False
+            return True
+
+    def memory_footprint(self) -> int:
+        with self._lock:
+            size = sys.getsizeof(self._bloom.bits) + sys.getsizeof(self._index) + sys.getsizeof(self._ids)
+            for key, owners in self._index.items():
+                size += sys.getsizeof(key) + sys.getsizeof(owners)
+            return size
+
+    def stats(self) -> dict:
+        with self._lock:
+            # false positive rate = false positives / all lookups for emails that are not stored
+            absent = self.bloom_negatives + self.false_positives
+            stats = {
+                "name": self.name,
+                "loaded": self.loaded,
+                "emails": len(self._index),
+                "bloom_bits": self._bloom.size,
+                "bloom_hashes": self._bloom.hash_count,
+                "bloom_bytes": len(self._bloom.bits),
+                "expected_false_positive_rate": self._bloom.expected_false_positive_rate(),
+                "lookups": self.lookups,
+                "bloom_negatives": self.bloom_negatives,
+                "false_positives": self.false_positives,
+                "observed_false_positive_rate": self.false_positives / absent if absent else 0.0,
+            }
+        stats["memory_bytes"] = self.memory_footprint()
+        return stats
+
+
+patient_emails = EmailDirectory("patients")
+user_emails = EmailDirectory("users")
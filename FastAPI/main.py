@@ -1,17 +1,59 @@
 from fastapi import FastAPI, Depends, HTTPException, Request, Form, Query, Path
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from contextlib import asynccontextmanager
 from datetime import date, time, datetime
+import asyncio
+import logging
 
 import crud
 import database
+import email_directory
 import models
 import schemas
+from config import EMAIL_DIRECTORY_RESYNC_SECONDS
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+# EMAIL DIRECTORY
+def sync_email_directories():
+    db = database.SessionLocal()
+    try:
+        email_directory.patient_emails.reload(lambda: crud.get_patient_emails(db))
+        email_directory.user_emails.reload(lambda: crud.get_user_emails(db))
+    finally:
+        db.close()
+
+
+async def resync_email_directories():
+    # rows written by other processes only reach the directories here, the unique indexes guard the gap
+    while True:
+        await asyncio.sleep(EMAIL_DIRECTORY_RESYNC_SECONDS)
+        try:
+            await run_in_threadpool(sync_email_directories)
+        except Exception:
+            logger.exception("Email directory resync failed, retrying in %s seconds", EMAIL_DIRECTORY_RESYNC_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(sync_email_directories)
+    app.state.email_directory_resync = asyncio.create_task(resync_email_directories())
+    yield
+    app.state.email_directory_resync.cancel()
+    try:
+        await app.state.email_directory_resync
+    except asyncio.CancelledError:
+        pass
+
+
+app = FastAPI(lifespan=lifespan)
 
 # create all tables and columns in our database
 models.Base.metadata.create_all(bind=database.engine)
@@ -30,6 +72,15 @@ def get_db():
         db.close()
 
 
+# EMAIL DIRECTORY METRICS
+@app.get("/metrics/email-directory")
+def read_email_directory_metrics():
+    return {
+        "patients": email_directory.patient_emails.stats(),
+        "users": email_directory.user_emails.stats(),
+    }
+
+
 # EXCEPTION HANDLING
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -84,11 +135,20 @@ def create_patient_form(request: Request):
 def create_patient(request: Request, name: str = Form(...), email: str = Form(...), phone: str = Form(...),
                    db: Session = Depends(get_db)):
     patient_data = schemas.PatientCreate(name=name, email=email, phone=phone)
-    db_patient = crud.get_patient_by_email(db, email=patient_data.email)
-    if db_patient:
+    # only emails the directory might already hold need the database lookup
+    if email_directory.patient_emails.might_contain(patient_data.email):
+        db_patient = crud.get_patient_by_email(db, email=patient_data.email)
+        if db_patient:
+            return templates.TemplateResponse("patients/create.html",
+                                              {"request": request, "error": "Email already registered"})
+    try:
+        db_patient = crud.create_patient(db=db, patient=patient_data)
+    except IntegrityError:
+        # written elsewhere since the last resync, the unique index caught it
+        db.rollback()
         return templates.TemplateResponse("patients/create.html",
                                           {"request": request, "error": "Email already registered"})
-    crud.create_patient(db=db, patient=patient_data)
+    email_directory.patient_emails.add(db_patient.id, db_patient.email)
     return RedirectResponse(url="/patients/", status_code=303)
 
 
@@ -127,7 +187,7 @@ def update_patient(
     patient_update = schemas.PatientCreate(name=name, email=email, phone=phone)
     try:
 
-        if email:
+        if email and email_directory.patient_emails.might_contain(email):
             existing_patient = crud.get_patient_by_email(db, email=email)
             if existing_patient and existing_patient.id != patient_id:
                 return templates.TemplateResponse("patients/update.html", {"request": request, "patient": patient_update, "error": "Email already exists."})
@@ -135,8 +195,17 @@ def update_patient(
         updated_patient = crud.update_patient(db, patient_id=patient_id, patient_update=patient_update)
         if not updated_patient:
             raise HTTPException(status_code=404, detail="Patient not found")
+        if updated_patient.email:
+            email_directory.patient_emails.add(updated_patient.id, updated_patient.email)
+        else:
+            email_directory.patient_emails.discard(updated_patient.id)
         return RedirectResponse(url=f"/patients/{patient_id}", status_code=303)
+    except IntegrityError:
+        # written elsewhere since the last resync, the unique index caught it
+        db.rollback()
+        return templates.TemplateResponse("patients/update.html", {"request": request, "patient": patient_update, "error": "Email already exists."})
     except Exception as e:
+        db.rollback()
         return templates.TemplateResponse("patients/update.html", {"request": request, "patient": patient_update, "error": str(e)})
 
 
@@ -146,6 +215,7 @@ def delete_patient(request: Request, patient_id: int, db: Session = Depends(get_
     if db_patient is None:
         raise HTTPException(status_code=404, detail="Patient not found")
     crud.delete_patient(db=db, patient_id=patient_id)
+    email_directory.patient_emails.discard(patient_id)
     return RedirectResponse(url="/patients/", status_code=303)
 
 
@@ -213,11 +283,18 @@ def register_user_form(request: Request):
 def register_user(request: Request, name: str = Form(...), email: str = Form(...), phone: str = Form(...),
                   password: str = Form(...), db: Session = Depends(get_db)):
     user_data = schemas.UserCreate(name=name, email=email, phone=phone, password=password)
-    db_user = crud.get_user_by_email(db, email=user_data.email)
-    if db_user:
+    if email_directory.user_emails.might_contain(user_data.email):
+        db_user = crud.get_user_by_email(db, email=user_data.email)
+        if db_user:
+            return templates.TemplateResponse("users/register.html",
+                                              {"request": request, "error": "Email already registered. Try logging in"})
+    try:
+        db_user = crud.create_user(db=db, user=user_data)
+    except IntegrityError:
+        db.rollback()
         return templates.TemplateResponse("users/register.html",
                                           {"request": request, "error": "Email already registered. Try logging in"})
-    crud.create_user(db=db, user=user_data)
+    email_directory.user_emails.add(db_user.id, db_user.email)
     return RedirectResponse(url="/", status_code=303)
 
 
@@ -0,0 +1,86 @@
+from email_directory import BloomFilter, EmailDirectory
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    keys = [f"user{i}@example.com" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+
+def test_directory_has_no_false_negatives_after_load_and_add():
+    directory = EmailDirectory("patients")
+    directory.load([(i, f"patient{i}@example.com") for i in range(2000)])
+    directory.add(5000, "new@example.com")
+    assert all(directory.might_contain(f"patient{i}@example.com") for i in range(2000))
+    assert directory.might_contain("new@example.com")
+
+
+def test_directory_is_case_insensitive():
+    directory = EmailDirectory("users")
+    directory.load([(1, "Alice@Example.com")])
+    assert directory.might_contain("alice@example.com")
+    assert directory.might_contain(" ALICE@EXAMPLE.COM ")
+
+
+def test_directory_answers_everything_before_load():
+    directory = EmailDirectory("users")
+    assert directory.might_contain("anyone@example.com")
+
+
+def test_discard_removes_email():
+    directory = EmailDirectory("patients")
+    directory.load([(1, "bob@example.com"), (2, "carol@example.com")])
+    directory.discard(1)
+    assert not directory.might_contain("bob@example.com")
+    assert directory.might_contain("carol@example.com")
+
+
+def test_add_replaces_previous_email_of_row():
+    directory = EmailDirectory("patients")
+    directory.load([(1, "old@example.com")])
+    directory.add(1, "new@example.com")
+    assert not directory.might_contain("old@example.com")
+    assert directory.might_contain("new@example.com")
+
+
+def test_unchanged_email_is_not_added_twice():
+    directory = EmailDirectory("patients")
+    directory.load([(1, "dave@example.com")])
+    for _ in range(10):
+        directory.add(1, "Dave@example.com")
+    assert directory._bloom.count == 1
+
+
+def test_reload_keeps_writes_made_during_fetch():
+    directory = EmailDirectory("patients")
+    directory.load([(1, "gone@example.com")])
+
+    def fetch_rows():
+        # snapshot taken before these writes were committed
+        directory.add(2, "late@example.com")
+        directory.discard(1)
+        return [(1, "gone@example.com")]
+
+    directory.reload(fetch_rows)
+    assert directory.might_contain("late@example.com")
+    assert not directory.might_contain("gone@example.com")
+
+
+def test_stats_counters():
+    directory = EmailDirectory("users")
+    directory.load([(1, "erin@example.com")])
+    directory.might_contain("erin@example.com")
+    for i in range(100):
+        directory.might_contain(f"stranger{i}@example.com")
+
+    stats = directory.stats()
+    assert stats["name"] == "users"
+    assert stats["loaded"]
+    assert stats["emails"] == 1
+    assert stats["lookups"] == 101
+    assert stats["bloom_negatives"] + stats["false_positives"] == 100
+    assert stats["observed_false_positive_rate"] == stats["false_positives"] / 100
+    assert 0 < stats["expected_false_positive_rate"] < directory.error_rate
+    assert stats["memory_bytes"] >= stats["bloom_bytes"] > 0